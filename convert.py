@@ -6,17 +6,70 @@ import shutil
 import tempfile
 import logging
 import re
+import errno
+import functools
+import json
+import multiprocessing
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("conversion_errors.log"),
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class BufferedFileHandler(logging.FileHandler):
+    """FileHandler with a large write buffer, flushed only on ERROR records and on close"""
+    def __init__(self, filename, buffering=1 << 16, **kwargs):
+        self.buffering = buffering
+        super().__init__(filename, **kwargs)
+    
+    def _open(self):
+        return open(self.baseFilename, self.mode, encoding=self.encoding,
+                    errors=self.errors, buffering=self.buffering)
+    
+    def flush(self):
+        # Tidak flush per baris, buffer ditulis saat penuh / ERROR / close
+        pass
+    
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= logging.ERROR:
+            super().flush()
+
+def setup_logging():
+    """Setup logging: all processes log into one queue, a single listener writes file + console.
+    Returns (log_queue, stop_logging); stop_logging flushes the log file and restores old handlers"""
+    root = logging.getLogger()
+    previous_handlers, previous_level = root.handlers[:], root.level
+    log_queue = multiprocessing.Queue(-1)
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        BufferedFileHandler("conversion_errors.log"),
         logging.StreamHandler()
     ]
-)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    init_worker_logging(log_queue)
+    
+    def stop_logging():
+        listener.stop()
+        for handler in handlers:
+            handler.close()
+        root.handlers = previous_handlers
+        root.setLevel(previous_level)
+    
+    return log_queue, stop_logging
+
+def init_worker_logging(log_queue):
+    """Route this process's log records to the parent's queue (also used as pool initializer)"""
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
 
+@functools.lru_cache(maxsize=1)
 def get_ffmpeg_path():
     """Get FFmpeg path with fallbacks"""
     # Try common paths
@@ -28,144 +81,578 @@ def get_ffmpeg_path():
     ]
     
     for path in paths:
-        if shutil.which(path) or os.path.exists(path):
-            return path
+        # which() sudah cek file ada + executable, kembalikan path lengkap
+        resolved = shutil.which(path)
+        if resolved:
+            return resolved
     
     logging.error("FFmpeg tidak ditemukan! Silakan instal FFmpeg terlebih dahulu.")
     logging.info("Download dari: https://github.com/BtbN/FFmpeg-Builds/releases")
     logging.info("Ekstrak ke C:\\ffmpeg dan tambahkan ke PATH")
     return None
 
-def convert_file(ffmpeg_path, input_path, output_path):
+# Jumlah file maksimum per proses FFmpeg
+# (worker x batch x THREADS dijaga sekitar jumlah core, lihat convert_folder)
+BATCH_SIZE = 4
+# GeForce membatasi jumlah sesi NVENC bersamaan, batch NVENC dibuat kecil
+NVENC_BATCH_SIZE = 3
+
+# Opsi FFmpeg yang sama untuk setiap file
+HWACCEL_ARGS = ('-hwaccel', 'auto')  # Decode dengan GPU jika tersedia
+HWACCEL_ARGS_NVENC = ('-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda')  # Frame tetap di VRAM
+
+# Optimized video settings for MPEG
+ENCODE_ARGS_V = (
+    '-c:v', 'mpeg2video',    # Codec video MPEG-2
+    '-b:v', '600k',          # Bitrate video target
+    '-maxrate', '800k',      # Bitrate maksimum
+    '-bufsize', '1200k',     # Buffer size
+    '-g', '15',              # GOP size lebih pendek
+    '-bf', '0',              # Nonaktifkan B-frames
+    '-mbd', 'simple',        # Keputusan macroblock cepat (tanpa RD)
+    '-motion_est', 'epzs',   # Motion estimation cepat
+    '-trellis', '0',         # Nonaktifkan trellis quantization
+    '-r', '24',              # Frame rate 24fps
+)
+SCALE_ARGS = ('-vf', 'scale=640:360')  # Resolusi 360p (640x360)
+
+# Video settings untuk NVENC
+NVENC_ARGS_V = (
+    '-c:v', 'h264_nvenc',    # Codec video H.264 (GPU)
+    '-preset', 'p4',         # Preset NVENC seimbang
+    '-tune', 'll',           # Low latency
+    '-b:v', '600k',          # Bitrate video target
+    '-maxrate', '800k',      # Bitrate maksimum
+    '-bufsize', '1200k',     # Buffer size
+    '-bf', '0',              # Nonaktifkan B-frames
+    '-g', '15',              # GOP size lebih pendek
+    '-r', '24',              # Frame rate 24fps
+)
+SCALE_ARGS_NVENC = ('-vf', 'scale_npp=640:360')  # Resolusi 360p di GPU
+
+# Video sudah MPEG-2 640x360: cukup di-copy tanpa encode ulang
+COPY_ARGS_V = ('-c:v', 'copy')
+
+# Optimized audio settings
+ENCODE_ARGS_A = (
+    '-c:a', 'mp2',           # Codec audio MP2
+    '-b:a', '48k',           # Bitrate audio
+    '-ar', '32000',          # Sample rate
+    '-ac', '1',              # Mono audio
+)
+
+THREADS = '2'  # Thread per decoder/encoder (worker x batch x thread = jumlah core)
+
+# Output FFmpeg: hanya error di stderr, progress mesin (key=value) di stdout
+LOG_ARGS = ('-nostats', '-loglevel', 'error')
+PROGRESS_ARGS = ('-progress', 'pipe:1', *LOG_ARGS)
+PROGRESS_INTERVAL = 30  # Detik antar log progress per file
+
+# Karakter yang tidak valid untuk nama file
+_INVALID_CHARS = re.compile(r'[<>:"/\\|?*]')
+_SANITIZE_CACHE = {}
+
+# Hasil ffprobe per (path, mtime, size)
+_PROBE_CACHE = {}
+
+# umask proses (os.umask hanya bisa dibaca dengan mengesetnya)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def check_nvenc(ffmpeg_path):
+    """Check whether h264_nvenc is built in AND an NVIDIA GPU can actually encode"""
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-encoders'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+        if b"h264_nvenc" not in result.stdout:
+            return False
+        
+        # Build FFmpeg bisa punya NVENC walau tidak ada GPU: coba encode 1 frame
+        result = subprocess.run(
+            [
+                ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', 'nullsrc=s=256x256',
+                '-frames:v', '1', '-c:v', 'h264_nvenc',
+                '-f', 'null', '-'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0
+
+def get_ffprobe_path(ffmpeg_path):
+    """Find ffprobe next to the FFmpeg executable, else on PATH"""
+    name = "ffprobe.exe" if ffmpeg_path.lower().endswith(".exe") else "ffprobe"
+    return shutil.which(os.path.join(os.path.dirname(ffmpeg_path), name)) or shutil.which("ffprobe")
+
+def probe_video(ffprobe_path, input_path, input_mtime, input_size):
+    """Get codec, resolution and duration of the first video stream (cached).
+    Returns None without ffprobe, {} if ffprobe could not read a video stream"""
+    if not ffprobe_path:
+        return None
+    
+    key = (input_path, input_mtime, input_size)
+    if key in _PROBE_CACHE:
+        return _PROBE_CACHE[key]
+    
+    try:
+        result = subprocess.run(
+            [
+                ffprobe_path,
+                '-v', 'error',
+                '-select_streams', 'v:0',
+                '-show_entries', 'stream=width,height,codec_name,r_frame_rate,bit_rate,has_b_frames:format=duration',
+                '-of', 'json',
+                input_path
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+        info = json.loads(result.stdout)
+        streams = info.get('streams')
+        video = dict(streams[0], duration=info.get('format', {}).get('duration')) if streams else {}
+    except (OSError, subprocess.SubprocessError, ValueError):
+        video = {}
+    
+    _PROBE_CACHE[key] = video
+    return video
+
+def output_complete(ffprobe_path, tmp_output, video):
+    """Check a batch output is readable and as long as its source (needs ffprobe)"""
+    if not ffprobe_path or not video or not video.get('duration'):
+        return False
+    try:
+        if os.path.getsize(tmp_output) == 0:
+            return False
+        result = subprocess.run(
+            [ffprobe_path, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', tmp_output],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=30
+        )
+        return result.returncode == 0 and abs(float(result.stdout) - float(video['duration'])) <= 1.0
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return False
+
+def is_target_video(video):
+    """Check if video stream already matches the output spec (remux only):
+    MPEG-2 640x360, 24fps, no B-frames, bitrate within the 800k cap"""
+    if not video:
+        return False
+    try:
+        bit_rate = int(video.get('bit_rate', 0))
+    except ValueError:
+        bit_rate = 0
+    return video.get('codec_name') == 'mpeg2video' \
+        and video.get('width') == 640 and video.get('height') == 360 \
+        and video.get('r_frame_rate') == '24/1' \
+        and video.get('has_b_frames') == 0 \
+        and 0 < bit_rate <= 800000
+
+def fits_target(video):
+    """Check if video stream is already at most 640x360 with even dimensions"""
+    width, height = (video or {}).get('width', 0), (video or {}).get('height', 0)
+    # Ukuran ganjil (mis. 426x239) ditolak encoder 4:2:0, jadi tetap di-scale ke 640x360
+    return 0 < width <= 640 and 0 < height <= 360 and width % 2 == 0 and height % 2 == 0
+
+def needs_short_path(path):
+    """Check if FFmpeg may fail on this path (long Windows path or non-cp1252 characters)"""
+    if os.name != 'nt':
+        return False
+    if len(path) > 240:
+        return True
+    try:
+        path.encode('cp1252')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+def build_input_args(input_path, use_nvenc=False):
+    """Build FFmpeg input options for one source file"""
+    hwaccel_args = HWACCEL_ARGS_NVENC if use_nvenc else HWACCEL_ARGS
+    # -threads sebelum -i membatasi thread decoder juga
+    return (*hwaccel_args, '-threads', THREADS, '-i', input_path)
+
+def build_output_args(output_path, use_nvenc=False, video=None, index=0):
+    """Build FFmpeg encoding options for one output file, video = ffprobe stream info or None,
+    index = position of its source among the command's inputs"""
+    if is_target_video(video):
+        video_args = COPY_ARGS_V
+    elif fits_target(video):
+        # Sudah <= 640x360 (genap), tidak perlu filter scale
+        video_args = NVENC_ARGS_V if use_nvenc else ENCODE_ARGS_V
+    elif use_nvenc:
+        video_args = (*NVENC_ARGS_V, *SCALE_ARGS_NVENC)
+    else:
+        video_args = (*ENCODE_ARGS_V, *SCALE_ARGS)
+    # Pilih stream yang sama untuk file tunggal maupun batch: video pertama, audio pertama jika ada
+    map_args = ('-map', f'{index}:v:0', '-map', f'{index}:a:0?')
+    return (*map_args, *video_args, *ENCODE_ARGS_A, '-threads', THREADS, '-f', 'mpeg', output_path)
+
+def file_sizes(input_path, output_path):
+    """Return (input_size, output_size) in bytes"""
+    return os.path.getsize(input_path), os.path.getsize(output_path)
+
+def size_report(input_size, output_size):
+    """Build size/compression message from sizes in bytes"""
+    input_size = input_size / (1024 * 1024)  # MB
+    output_size = output_size / (1024 * 1024)  # MB
+    compression_ratio = (1 - (output_size / input_size)) * 100 if input_size > 0 else 0
+    return f"Ukuran: {output_size:.2f}MB (Kompresi: {compression_ratio:.1f}%)"
+
+def make_temp_output(output_path):
+    """Create an empty temp .mpeg next to output_path (same volume, so it can be renamed)"""
+    fd, tmp_output = tempfile.mkstemp(suffix='.mpeg', dir=os.path.dirname(output_path))
+    os.close(fd)
+    # mkstemp membuat file 0600; pakai mode biasa (0666 & ~umask) karena file ini
+    # di-rename menjadi output akhir
+    os.chmod(tmp_output, 0o666 & ~_UMASK)
+    return tmp_output
+
+def move_output(tmp_output, output_path):
+    """Move finished output into place, O(1) rename when on the same volume"""
+    try:
+        os.replace(tmp_output, output_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Beda volume (misalnya temp dir sistem), fallback ke copy
+        shutil.move(tmp_output, output_path)
+
+def _log_progress(stream, label):
+    """Parse FFmpeg -progress key=value output and log it periodically"""
+    progress = {}
+    last_log = time.time()
+    for line in stream:
+        key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+        progress[key] = value
+        # Satu blok progress selesai ditandai dengan key "progress"
+        if key == 'progress' and value == 'continue' and time.time() - last_log >= PROGRESS_INTERVAL:
+            last_log = time.time()
+            out_time = progress.get('out_time', '').split('.')[0]
+            logging.info(f"   ⏳ {label}: {out_time} (frame {progress.get('frame', '?')}, {progress.get('speed', '?')})")
+
+def run_ffmpeg(command, timeout, label):
+    """Run FFmpeg (built with PROGRESS_ARGS) and return (returncode, last stderr lines as bytes)"""
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1 << 20
+    )
+    
+    # Baca stderr (hanya error) dan progress di thread terpisah
+    stderr_tail = deque(maxlen=64)
+    readers = [
+        threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True),
+        threading.Thread(target=_log_progress, args=(process.stdout, label), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+        process.stdout.close()
+        process.stderr.close()
+    
+    return process.returncode, list(stderr_tail)
+
+def convert_file(ffmpeg_path, input_path, output_path, use_nvenc=False, video=None):
     """Convert single file with optimized compression for old Android devices"""
+    tmp_dir = None
+    tmp_output = None
     try:
-        # Create temp directory with short path
-        with tempfile.TemporaryDirectory() as tmp_dir:
+        if needs_short_path(input_path) or needs_short_path(output_path):
             # Copy to temp location with short name
+            tmp_dir = tempfile.mkdtemp()
             tmp_input = os.path.join(tmp_dir, "input.mp4")
             shutil.copy2(input_path, tmp_input)
+            tmp_output = os.path.join(tmp_dir, "output.mpeg")
+        else:
+            # Baca input langsung, output sementara di folder tujuan (rename atomik)
+            tmp_input = input_path
+            tmp_output = make_temp_output(output_path)
+        
+        # Run FFmpeg conversion with optimized settings
+        command = (
+            ffmpeg_path,
+            '-y',  # Timpa file output sementara
+            *PROGRESS_ARGS,
+            *build_input_args(tmp_input, use_nvenc),
+            *build_output_args(tmp_output, use_nvenc, video)
+        )
+        
+        # Run and keep the end of FFmpeg's output
+        returncode, stderr_tail = run_ffmpeg(command, timeout=600, label=os.path.basename(input_path))  # 10 minutes timeout
+        
+        # Check result
+        if returncode == 0:
+            # Pindahkan hasil konversi ke tujuan akhir
+            move_output(tmp_output, output_path)
+            tmp_output = None
             
-            # Run FFmpeg conversion with optimized settings
-            command = [
-                ffmpeg_path,
-                '-i', tmp_input,
-                
-                # Optimized video settings for MPEG
-                '-c:v', 'mpeg2video',    # Codec video MPEG-2
-                '-b:v', '600k',          # Bitrate video target
-                '-maxrate', '800k',      # Bitrate maksimum
-                '-bufsize', '1200k',     # Buffer size
-                '-g', '15',              # GOP size lebih pendek
-                '-bf', '0',              # Nonaktifkan B-frames
-                '-vf', 'scale=640:360',  # Resolusi 360p (640x360)
-                '-r', '24',              # Frame rate 24fps
-                
-                # Optimized audio settings
-                '-c:a', 'mp2',           # Codec audio MP2
-                '-b:a', '48k',           # Bitrate audio
-                '-ar', '32000',          # Sample rate
-                '-ac', '1',              # Mono audio
-                
-                # Additional optimizations
-                '-threads', '0',         # Gunakan semua thread CPU
-                '-f', 'mpeg',            # Format output MPEG
-                os.path.join(tmp_dir, "output.mpeg")  # Format MPEG
-            ]
-            
-            # Run and capture output
-            result = subprocess.run(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                timeout=600  # 10 minutes timeout
-            )
+            # Dapatkan ukuran file untuk logging dan laporan
+            input_size, output_size = file_sizes(input_path, output_path)
+            return True, size_report(input_size, output_size), input_size, output_size
+        else:
+            # Dengan -loglevel error, stderr hanya berisi pesan error
+            error_msg = b"".join(stderr_tail)[-500:].decode('utf-8', 'replace').strip() or "Unknown error"
+            return False, error_msg, 0, 0
             
-            # Check result
-            if result.returncode == 0:
-                # Copy converted file to final destination
-                shutil.copy2(os.path.join(tmp_dir, "output.mpeg"), output_path)
-                
-                # Dapatkan ukuran file untuk logging
-                input_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
-                output_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
-                compression_ratio = (1 - (output_size / input_size)) * 100
-                
-                return True, f"Ukuran: {output_size:.2f}MB (Kompresi: {compression_ratio:.1f}%)"
-            else:
-                # Extract error message
-                error_lines = result.stderr.split('\n')
-                error_msg = ""
-                for line in error_lines:
-                    if "error" in line.lower() or "failed" in line.lower():
-                        error_msg = line.strip()
-                        break
-                if not error_msg:
-                    error_msg = result.stderr[-500:] or "Unknown error"
-                return False, error_msg
-                
     except Exception as e:
-        return False, str(e)
+        return False, str(e), 0, 0
+    finally:
+        # Bersihkan file sementara
+        if tmp_output and os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def convert_file_with_fallback(ffmpeg_path, input_path, output_path, use_nvenc=False, video=None):
+    """Convert single file, retry with MPEG-2 (CPU) settings if the NVENC job fails"""
+    result = convert_file(ffmpeg_path, input_path, output_path, use_nvenc, video)
+    if use_nvenc and not result[0]:
+        logging.warning(f"NVENC gagal untuk {os.path.basename(input_path)}, ulangi dengan MPEG-2: {result[1]}")
+        result = convert_file(ffmpeg_path, input_path, output_path, False, video)
+    return result
+
+def convert_batch(ffmpeg_path, files, use_nvenc=False, ffprobe_path=None):
+    """Convert several (input_path, output_path, video) entries in one FFmpeg process.
+    Returns one flag per entry: True if its output was written and moved into place"""
+    tmp_outputs = []
+    done = [False] * len(files)
+    try:
+        command = [ffmpeg_path, '-y', *PROGRESS_ARGS]  # Timpa file output sementara
+        for input_path, _, _ in files:
+            command += build_input_args(input_path, use_nvenc)
+        
+        # Satu output per input k, stream dipilih lewat -map k:v / k:a
+        for k, (_, output_path, video) in enumerate(files):
+            tmp_outputs.append(make_temp_output(output_path))
+            command += build_output_args(tmp_outputs[-1], use_nvenc, video, index=k)
+        
+        label = ", ".join(os.path.basename(input_path) for input_path, _, _ in files)
+        try:
+            returncode, stderr_tail = run_ffmpeg(command, timeout=600 * len(files), label=label)
+        except subprocess.TimeoutExpired:
+            # Waktu habis: output yang sudah selesai tetap bisa diselamatkan
+            returncode, stderr_tail = None, [b"Timeout"]
+        
+        if returncode != 0:
+            error_msg = b"".join(stderr_tail)[-500:].decode('utf-8', 'replace').strip() or "Unknown error"
+            logging.warning(f"Batch gagal ({label}), file yang belum lengkap diulang satu per satu: {error_msg}")
+        
+        # Batch gagal: simpan output yang tetap lengkap, sisanya diulang per file
+        for k, (tmp_output, (_, output_path, video)) in enumerate(zip(tmp_outputs, files)):
+            if returncode == 0 or output_complete(ffprobe_path, tmp_output, video):
+                move_output(tmp_output, output_path)
+                done[k] = True
+        
+    except (OSError, subprocess.SubprocessError):
+        pass
+    finally:
+        # Bersihkan file sementara
+        for tmp_output in tmp_outputs:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+    
+    return done
+
+def _convert_batch(job):
+    """Worker untuk process pool: convert satu batch,
+    return list of (input_path, success, skipped, msg, input_size, output_size)"""
+    ffmpeg_path, ffprobe_path, files, use_nvenc = job
+    results = []
+    pending = []
+    
+    for input_path, output_path, input_mtime, input_size in files:
+        # Skip jika file output sudah ada dan lebih baru (satu stat untuk cek ada + mtime)
+        try:
+            output_stat = os.stat(output_path)
+            if output_stat.st_mtime > input_mtime:
+                results.append((input_path, True, True, "", input_size, output_stat.st_size))
+                continue
+        except OSError:
+            pass
+        
+        # Cek codec/resolusi sumber untuk remux atau lewati scale
+        video = probe_video(ffprobe_path, input_path, input_mtime, input_size)
+        
+        # Path bermasalah (lewat temp dir) dan file tanpa stream video terbaca
+        # (rusak / audio saja) dikonversi sendiri agar tidak menggagalkan batch
+        unreadable = video is not None and not video
+        if unreadable or needs_short_path(input_path) or needs_short_path(output_path):
+            success, result_msg, input_size, output_size = convert_file_with_fallback(ffmpeg_path, input_path, output_path, use_nvenc, video)
+            results.append((input_path, success, False, result_msg, input_size, output_size))
+        else:
+            pending.append((input_path, output_path, video))
+    
+    done = convert_batch(ffmpeg_path, pending, use_nvenc, ffprobe_path) if len(pending) > 1 else [False] * len(pending)
+    for (input_path, output_path, video), converted in zip(pending, done):
+        if converted:
+            try:
+                input_size, output_size = file_sizes(input_path, output_path)
+                result_msg = size_report(input_size, output_size)
+            except OSError:
+                input_size, output_size, result_msg = 0, 0, "Ukuran tidak diketahui"
+            results.append((input_path, True, False, result_msg, input_size, output_size))
+        else:
+            # Satu file, atau gagal di batch: konversi per file agar error bisa dilacak
+            success, result_msg, input_size, output_size = convert_file_with_fallback(ffmpeg_path, input_path, output_path, use_nvenc, video)
+            results.append((input_path, success, False, result_msg, input_size, output_size))
+    
+    return results
+
+def _iter_mp4(root):
+    """Recursively yield DirEntry objects for MP4 files under root"""
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _iter_mp4(entry.path)
+                elif entry.name[-4:].lower() == '.mp4':
+                    yield entry
+    except OSError:
+        # Folder tidak bisa dibaca, lewati (sama seperti os.walk)
+        return
 
 def sanitize_filename(filename):
     """Remove problematic characters from filename"""
-    # Remove invalid characters
-    clean = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Shorten if too long
-    return clean[:150] if len(clean) > 150 else clean
+    clean = _SANITIZE_CACHE.get(filename)
+    if clean is not None:
+        return clean
+    
+    # Nama sudah bersih dan cukup pendek, tidak perlu diproses
+    if not _INVALID_CHARS.search(filename) and len(filename) <= 150:
+        _SANITIZE_CACHE[filename] = filename
+        return filename
+    
+    # Remove invalid characters and shorten if too long
+    clean = _INVALID_CHARS.sub('', filename)[:150]
+    _SANITIZE_CACHE[filename] = clean
+    return clean
 
-def convert_folder(input_folder, output_folder=None):
+def convert_folder(input_folder, output_folder=None, log_queue=None):
     """Convert all MP4 files in a folder to MPEG"""
+    if log_queue is not None:
+        return _convert_folder(input_folder, output_folder, log_queue)
+    
+    # Dipanggil langsung (misalnya sebagai modul): siapkan logging sendiri
+    log_queue, stop_logging = setup_logging()
+    try:
+        return _convert_folder(input_folder, output_folder, log_queue)
+    finally:
+        stop_logging()
+
+def _convert_folder(input_folder, output_folder, log_queue):
+    """Convert all MP4 files in a folder to MPEG, logging through log_queue"""
     ffmpeg_path = get_ffmpeg_path()
     if not ffmpeg_path:
         return
     
+    # Gunakan GPU NVIDIA jika tersedia, fallback ke MPEG-2 (CPU)
+    use_nvenc = check_nvenc(ffmpeg_path)
+    if use_nvenc:
+        logging.info("NVENC terdeteksi: video di-encode dengan h264_nvenc (GPU)")
+    
+    # ffprobe opsional: tanpa ffprobe semua file di-encode ulang penuh
+    ffprobe_path = get_ffprobe_path(ffmpeg_path)
+    if not ffprobe_path:
+        logging.warning("ffprobe tidak ditemukan, semua file akan di-encode ulang")
+    
     # Tentukan folder output
     if output_folder is None:
         output_folder = os.path.join(input_folder, "MPEG_360p_Output")  # Default
     
     os.makedirs(output_folder, exist_ok=True)
     
-    # Collect MP4 files
-    mp4_files = []
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file.lower().endswith('.mp4'):
-                full_path = os.path.join(root, file)
-                mp4_files.append(full_path)
-    
-    if not mp4_files:
-        logging.warning("Tidak ada file MP4 di folder ini")
-        return
-    
-    total_files = len(mp4_files)
-    logging.info(f"Ditemukan {total_files} file MP4 untuk dikonversi")
-    
-    # Convert files
+    # Cari file MP4 sambil langsung mengirim batch ke process pool
+    total_files = 0
     success_count = 0
+    total_input_size = 0
+    total_output_size = 0
+    failures = []
     start_time = time.time()
+    if use_nvenc:
+        # Satu proses agar jumlah sesi NVENC bersamaan tidak melebihi batch
+        batch_size = NVENC_BATCH_SIZE
+        workers = 1
+    else:
+        # Total transcode bersamaan = worker x batch, masing-masing THREADS thread:
+        # jaga totalnya sekitar jumlah core
+        streams = max(1, (os.cpu_count() or 2) // int(THREADS))
+        batch_size = min(BATCH_SIZE, streams)
+        workers = max(1, streams // batch_size)
     
-    for i, input_path in enumerate(mp4_files, 1):
-        filename = os.path.basename(input_path)
-        safe_name = sanitize_filename(filename)
-        output_path = os.path.join(output_folder, os.path.splitext(safe_name)[0] + ".mpeg")  # Ekstensi .mpeg
-        
-        logging.info(f"[{i}/{total_files}] Mengkonversi: {filename}")
+    # Worker mengirim log ke queue, hanya proses utama yang menulis file log
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_logging, initargs=(log_queue,)) as executor:
+        futures = {}
+        batch = []
+        for entry in _iter_mp4(input_folder):
+            safe_name = sanitize_filename(entry.name)
+            output_path = os.path.join(output_folder, os.path.splitext(safe_name)[0] + ".mpeg")  # Ekstensi .mpeg
+            total_files += 1
+            # Stat dari DirEntry (di Windows sudah ter-cache dari scandir)
+            try:
+                input_stat = entry.stat()
+                input_mtime, input_size = input_stat.st_mtime, input_stat.st_size
+            except OSError:
+                input_mtime, input_size = 0, 0
+            batch.append((entry.path, output_path, input_mtime, input_size))
+            # Batch awal kecil agar semua worker langsung terisi, lalu membesar
+            # sampai batch_size (jumlah total file belum diketahui saat scan)
+            if len(batch) >= min(batch_size, len(futures) // workers + 1):
+                futures[executor.submit(_convert_batch, (ffmpeg_path, ffprobe_path, batch, use_nvenc))] = batch
+                batch = []
+        if batch:
+            futures[executor.submit(_convert_batch, (ffmpeg_path, ffprobe_path, batch, use_nvenc))] = batch
         
-        # Skip jika file output sudah ada dan lebih baru
-        if os.path.exists(output_path) and os.path.getmtime(output_path) > os.path.getmtime(input_path):
-            logging.info(f"⏩ Dilewati: {filename} (sudah dikonversi)")
-            success_count += 1
-            continue
+        if not total_files:
+            logging.warning("Tidak ada file MP4 di folder ini")
+            return
         
-        success, result_msg = convert_file(ffmpeg_path, input_path, output_path)
+        logging.info(f"Ditemukan {total_files} file MP4 untuk dikonversi")
+        logging.info(f"Menggunakan {workers} proses paralel, maksimal {batch_size} file per batch")
         
-        if success:
-            success_count += 1
-            logging.info(f"✅ Berhasil: {filename} - {result_msg}")
-        else:
-            logging.error(f"❌ Gagal: {filename}")
-            logging.error(f"   Penyebab: {result_msg}")
+        i = 0
+        for future in as_completed(futures):
+            try:
+                batch_results = future.result()
+            except Exception as e:
+                # Worker error: tandai semua file di batch ini gagal, lanjutkan batch lain
+                batch_results = [(input_path, False, False, str(e), 0, 0) for input_path, _, _, _ in futures[future]]
+            
+            for input_path, success, skipped, result_msg, input_size, output_size in batch_results:
+                i += 1
+                filename = os.path.basename(input_path)
+                total_input_size += input_size
+                total_output_size += output_size
+                
+                if skipped:
+                    success_count += 1
+                    logging.info(f"[{i}/{total_files}] ⏩ Dilewati: {filename} (sudah dikonversi)")
+                elif success:
+                    success_count += 1
+                    logging.info(f"[{i}/{total_files}] ✅ Berhasil: {filename} - {result_msg}")
+                else:
+                    failures.append((i, filename))
+                    logging.error(f"[{i}/{total_files}] ❌ Gagal: {filename}")
+                    logging.error(f"   Penyebab: {result_msg}")
     
     # Generate report
     elapsed = time.time() - start_time
@@ -180,18 +667,6 @@ def convert_folder(input_folder, output_folder=None):
     
     # Hitung penghematan ruang
     if success_count > 0:
-        total_input_size = 0
-        total_output_size = 0
-        
-        for input_path in mp4_files:
-            if os.path.exists(input_path):
-                total_input_size += os.path.getsize(input_path)
-        
-        for file in os.listdir(output_folder):
-            if file.endswith(".mpeg"):
-                output_path = os.path.join(output_folder, file)
-                total_output_size += os.path.getsize(output_path)
-        
         total_input_mb = total_input_size / (1024 * 1024)
         total_output_mb = total_output_size / (1024 * 1024)
         savings = total_input_mb - total_output_mb
@@ -205,24 +680,32 @@ def convert_folder(input_folder, output_folder=None):
     logging.info("=" * 60)
     
     # Save failed files list
-    if success_count < total_files:
-        with open(os.path.join(output_folder, "failed_files.txt"), "w", encoding="utf-8") as f:
+    if failures:
+        with open(os.path.join(output_folder, "failed_files.txt"), "w", encoding="utf-8", buffering=1 << 20) as f:
             f.write("File yang gagal dikonversi:\n")
-            for i, input_path in enumerate(mp4_files, 1):
-                filename = os.path.basename(input_path)
-                output_path = os.path.join(output_folder, os.path.splitext(sanitize_filename(filename))[0] + ".mpeg")
-                if not os.path.exists(output_path):
-                    f.write(f"{i}. {filename}\n")
+            f.writelines(f"{i}. {filename}\n" for i, filename in failures)
 
 def main():
+    log_queue, stop_logging = setup_logging()
+    try:
+        converted = run(log_queue)
+    finally:
+        # Tulis sisa buffer log ke disk sebelum menunggu Enter
+        stop_logging()
+    
+    if converted and os.name == 'nt':
+        input("\nTekan Enter untuk keluar...")
+
+def run(log_queue):
+    """Interactive part of main, returns True if a conversion was run"""
     print("=" * 60)
     print("KONVERTER MP4 KE MPEG (360p)")
     print("=" * 60)
     print("Pengaturan kompresi yang digunakan:")
     print("- Format: MPEG (ekstensi .mpeg)")
-    print("- Resolusi: 640x360 (360p)")
+    print("- Resolusi: maksimal 640x360 (360p)")
     print("- Frame rate: 24fps")
-    print("- Video: MPEG2, 600kbps bitrate")
+    print("- Video: MPEG2, 600kbps bitrate (H.264 NVENC jika ada GPU NVIDIA)")
     print("- Audio: Mono, 48k bitrate, 32kHz sample rate")
     
     # Ambil folder input
@@ -252,10 +735,8 @@ def main():
         return
     
     # Jalankan konversi
-    convert_folder(input_folder, output_folder)
-    
-    if os.name == 'nt':
-        input("\nTekan Enter untuk keluar...")
+    convert_folder(input_folder, output_folder, log_queue)
+    return True
 
 if __name__ == "__main__":
     main()
\ No newline at end of file